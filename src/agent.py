@@ -1,29 +1,33 @@
 # src/agent.py
 import os
 import json
+import functools
 import logging
 import re
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from dataclasses import dataclass
 
 from .schemas import ChatRequest, ChatResponse
 
-# Lazy LLM imports (optional; safe if not installed)
+# Optional faster JSON parser for the menu file
 try:
-    import google.generativeai as genai
-    _HAS_GENAI = True
+    import orjson
+    _HAS_ORJSON = True
 except Exception:
-    genai = None
-    _HAS_GENAI = False
+    orjson = None
+    _HAS_ORJSON = False
 
+# Optional Aho-Corasick matcher; match_items falls back to plain substring scans
 try:
-    import openai
-    _HAS_OPENAI = True
+    import ahocorasick
+    _HAS_AHOCORASICK = True
 except Exception:
-    openai = None
-    _HAS_OPENAI = False
+    ahocorasick = None
+    _HAS_AHOCORASICK = False
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -32,16 +36,47 @@ if not logger.handlers:
     ch.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
     logger.addHandler(ch)
 
-
-@dataclass
+# Upper bound on in-memory sessions before the least recently used is evicted
+MAX_SESSIONS = 100_000
+
+# Patterns used on every request; compiled once at import
+_RE_NORMALIZE = re.compile(r"[^a-z0-9 ]")
+# ASCII bytes stripped by _RE_NORMALIZE; bytes.translate deletes them without the regex engine
+_NORMALIZE_KEEP = frozenset(b"abcdefghijklmnopqrstuvwxyz0123456789 ")
+_NORMALIZE_DELETE = bytes(c for c in range(128) if c not in _NORMALIZE_KEEP)
+_RE_GREETING = re.compile(r"\b(hi|hello|hey|good morning|good evening)\b")
+_RE_CANCEL = re.compile(r"\b(cancel|never mind|stop|don't)\b")
+_RE_CONFIRM = re.compile(r"(yes|yep|confirm|please|sure|ok)")
+_RE_QTY = re.compile(r"(\d+)\s*(?:x|pcs|pieces)?\s*(.+)")
+# dietary cues; a bare "nut" only counts once another cue has opened the preference branch
+_RE_DIET = re.compile(
+    r"(?P<vegetarian>vegetarian|vegan)|(?P<no_onion>no onion)|(?P<no_dairy>no dairy|dairy-free)"
+    r"|(?P<no_nuts>nut allergy)|(?P<nut>nut)"
+)
+_DIET_LABELS = ("vegetarian", "no_onion", "no_dairy", "no_nuts")
+_RE_ORDER_VERB = re.compile(r"\b(order|i want|i'd like|get me|bring me|please get|i need)\b")
+
+
+@dataclass(slots=True)
 class OrderItem:
     name: str
     quantity: int = 1
-    tags: Optional[List[str]] = None
+    tags: Optional[Sequence[str]] = None
     available: bool = True
     prep_time_min: Optional[int] = None
     menu_id: Optional[str] = None
 
+    def to_dict(self) -> Dict[str, Any]:
+        # direct literal instead of dataclasses.asdict (which deep-copies recursively)
+        return {
+            "name": self.name,
+            "quantity": self.quantity,
+            "tags": list(self.tags) if self.tags is not None else None,
+            "available": self.available,
+            "prep_time_min": self.prep_time_min,
+            "menu_id": self.menu_id,
+        }
+
 
 class AgentClient:
     def __init__(self):
@@ -49,14 +84,28 @@ class AgentClient:
         self.gemini_key = os.environ.get("GEMINI_API_KEY")
         self.openai_key = os.environ.get("OPENAI_API_KEY")
         self.backend = "mock"
-        if self.gemini_key and _HAS_GENAI:
-            self.backend = "gemini"
+        # LLM SDKs are imported only for the backend in use (optional; safe if not installed)
+        self._genai = None
+        self._openai = None
+        if self.gemini_key:
+            try:
+                import google.generativeai as genai
+                self._genai = genai
+                self.backend = "gemini"
+            except Exception:
+                pass
+            else:
+                try:
+                    genai.configure(api_key=self.gemini_key)
+                except Exception:
+                    pass
+        if self.backend == "mock" and self.openai_key:
             try:
-                genai.configure(api_key=self.gemini_key)
+                import openai
+                self._openai = openai
+                self.backend = "openai"
             except Exception:
                 pass
-        elif self.openai_key and _HAS_OPENAI:
-            self.backend = "openai"
         logger.info("Agent backend: %s", self.backend)
 
         # synonyms to help matching
@@ -71,9 +120,11 @@ class AgentClient:
 
         # load menu (data/menu.json or data/data.json fallback)
         self.menu = self._load_menu()
+        self._build_matcher()
 
-        # in-memory session store: session_id -> context dict
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        # in-memory session store: session_id -> context dict, least recently used evicted first
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sess_lock = threading.Lock()
 
     # -------------------------
     # Menu loader
@@ -90,61 +141,116 @@ class AgentClient:
 
         if chosen:
             try:
-                with open(chosen, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    logger.info("Loaded menu from %s (%d items)", chosen, len(data))
-                    return data
+                if _HAS_ORJSON:
+                    data = orjson.loads(chosen.read_bytes())
+                else:
+                    with open(chosen, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                logger.info("Loaded menu from %s (%d items)", chosen, len(data))
+                # precompute normalized forms so matching never re-normalizes menu rows
+                for item in data:
+                    item["_norm_name"] = self._normalize(item.get("name", ""))
+                    item["_norm_tokens"] = frozenset(item["_norm_name"].split())
+                    item["_norm_tags"] = [t.lower() for t in (item.get("tags") or [])]
+                    # shared by every OrderItem built from this row
+                    item["_tags_tuple"] = tuple(item.get("tags") or [])
+                    item["_menu_id"] = self._menu_id(item)
+                return data
             except Exception as e:
                 logger.error("Failed to load menu file: %s", e)
         logger.warning("No menu file found; starting with empty menu.")
         return []
 
+    # -------------------------
+    # Match index (built once per menu load)
+    # -------------------------
+    def _build_matcher(self):
+        """Index menu names/tags/synonyms so match_items does one pass over the text.
+
+        Index values are int bitmasks over menu positions (bit i = self.menu[i]),
+        so combining hits is a single OR per key instead of per-item set updates.
+        """
+        self._token_index: Dict[str, int] = {}
+        self._substring_index: Dict[str, int] = {}
+        by_norm_name: Dict[str, int] = {}
+        for idx, item in enumerate(self.menu):
+            bit = 1 << idx
+            for tok in item["_norm_tokens"]:
+                self._token_index[tok] = self._token_index.get(tok, 0) | bit
+            by_norm_name[item["_norm_name"]] = by_norm_name.get(item["_norm_name"], 0) | bit
+            for key in {item["_norm_name"]} | set(item["_norm_tags"]):
+                if key:
+                    self._substring_index[key] = self._substring_index.get(key, 0) | bit
+
+        # a synonym key hits the same items as the dish name it stands for
+        for k, v in self.synonyms.items():
+            mask = by_norm_name.get(self._normalize(v), 0)
+            if mask:
+                self._substring_index[k] = self._substring_index.get(k, 0) | mask
+
+        self._ac = None
+        if _HAS_AHOCORASICK and self._substring_index:
+            self._ac = ahocorasick.Automaton()
+            for key, mask in self._substring_index.items():
+                self._ac.add_word(key, mask)
+            self._ac.make_automaton()
+
+        self._menu_by_id: Dict[str, Dict[str, Any]] = {item["_menu_id"]: item for item in self.menu}
+
+        # parse results depend on the index, so start a fresh cache whenever it is rebuilt
+        self._parse_cached = functools.lru_cache(maxsize=4096)(self._parse_impl)
+
     # -------------------------
     # Helpers: normalize & synonyms
     # -------------------------
     def _normalize(self, s: str) -> str:
-        return re.sub(r"[^a-z0-9 ]", "", s.lower())
+        s = s.lower()
+        if s.isascii():
+            return s.encode("ascii").translate(None, _NORMALIZE_DELETE).decode("ascii")
+        return _RE_NORMALIZE.sub("", s)
+
+    def _menu_id(self, item: Dict[str, Any]) -> str:
+        return str(item.get("id") or item.get("_id") or item.get("name", ""))
+
+    def _make_order_item(self, item: Dict[str, Any], quantity: int = 1) -> OrderItem:
+        return OrderItem(name=item.get("name", ""), quantity=quantity, tags=item["_tags_tuple"],
+                         available=bool(item.get("available", True)), prep_time_min=item.get("prep_time_min"),
+                         menu_id=item["_menu_id"])
 
     # -------------------------
     # Matching items by name/tag/synonym
     # -------------------------
-    def match_items(self, text: str) -> List[OrderItem]:
-        """Return list of OrderItem matched from the menu."""
+    def match_items(self, text: str, _normalized: Optional[str] = None,
+                    _tokens: Optional[List[str]] = None) -> List[OrderItem]:
+        """Return list of OrderItem matched from the menu.
+
+        Callers that already normalized ``text`` can pass the result (and its
+        tokens) to skip doing it again.
+        """
         if not self.menu:
             return []
 
-        normalized = self._normalize(text)
-
-        # apply synonyms
-        for k, v in self.synonyms.items():
-            if k in normalized:
-                normalized = normalized.replace(k, self._normalize(v))
-
+        normalized = _normalized if _normalized is not None else self._normalize(text)
+        tokens = _tokens if _tokens is not None else normalized.split()
+
+        # collect menu indices hit by name token, or by name/tag/synonym substring
+        hits = 0
+        for tok in tokens:
+            hits |= self._token_index.get(tok, 0)
+        if self._ac is not None:
+            for _, mask in self._ac.iter(normalized):
+                hits |= mask
+        else:
+            for key, mask in self._substring_index.items():
+                if key in normalized:
+                    hits |= mask
+
+        # walk set bits lowest-first, i.e. in menu order
         found: List[OrderItem] = []
-        for item in self.menu:
-            name = item.get("name", "")
-            tags = item.get("tags", []) or []
-            id_ = item.get("id") or item.get("_id") or name
-
-            # exact name contained
-            if self._normalize(name) in normalized:
-                found.append(OrderItem(name=name, tags=tags, available=bool(item.get("available", True)),
-                                       prep_time_min=item.get("prep_time_min"), menu_id=str(id_)))
-                continue
-
-            # token match in name
-            for tok in normalized.split():
-                if tok and tok in self._normalize(name).split():
-                    found.append(OrderItem(name=name, tags=tags, available=bool(item.get("available", True)),
-                                           prep_time_min=item.get("prep_time_min"), menu_id=str(id_)))
-                    break
-
-            # tag match
-            for tag in tags:
-                if tag and tag in normalized:
-                    found.append(OrderItem(name=name, tags=tags, available=bool(item.get("available", True)),
-                                           prep_time_min=item.get("prep_time_min"), menu_id=str(id_)))
-                    break
+        while hits:
+            low = hits & -hits
+            found.append(self._make_order_item(self.menu[low.bit_length() - 1]))
+            hits ^= low
 
         # dedupe by menu_id
         uniq: Dict[str, OrderItem] = {}
@@ -156,55 +262,53 @@ class AgentClient:
     # Simple parser: intents & quantity detection
     # -------------------------
     def parse(self, text: str) -> Dict[str, Any]:
-        t = text.strip().lower()
+        intent, item_refs, dietary = self._parse_cached(text.strip().lower())
+        items = [self._make_order_item(self._menu_by_id[menu_id], quantity=qty) for menu_id, qty in item_refs]
+        return {"intent": intent, "items": items, "dietary": list(dietary)}
 
+    def _parse_impl(self, t: str) -> Tuple[str, Tuple[Tuple[str, int], ...], Tuple[str, ...]]:
+        """Pure part of parse(): (intent, ((menu_id, qty), ...), dietary), hashable for caching."""
         # greeting
-        if re.search(r"\b(hi|hello|hey|good morning|good evening)\b", t):
-            return {"intent": "greeting", "items": [], "dietary": []}
+        if _RE_GREETING.search(t):
+            return "greeting", (), ()
 
         # cancel
-        if re.search(r"\b(cancel|never mind|stop|don't)\b", t):
-            return {"intent": "cancel", "items": [], "dietary": []}
+        if _RE_CANCEL.search(t):
+            return "cancel", (), ()
 
         # confirm (short positive)
-        if re.fullmatch(r"\b(yes|yep|confirm|please|sure|ok)\b", t):
-            return {"intent": "confirm", "items": [], "dietary": []}
+        if _RE_CONFIRM.fullmatch(t):
+            return "confirm", (), ()
 
         # set preferences
-        if any(k in t for k in ("vegetarian", "vegan", "no onion", "no dairy", "dairy-free", "nut allergy")):
-            dietary = []
-            if "vegetarian" in t or "vegan" in t:
-                dietary.append("vegetarian")
-            if "no onion" in t:
-                dietary.append("no_onion")
-            if "no dairy" in t or "dairy-free" in t:
-                dietary.append("no_dairy")
-            if "nut" in t:
-                dietary.append("no_nuts")
-            return {"intent": "set_preference", "items": [], "dietary": dietary}
+        diet_hits = {m.lastgroup for m in _RE_DIET.finditer(t)}
+        if diet_hits - {"nut"}:
+            if "nut" in diet_hits:
+                diet_hits.add("no_nuts")
+            return "set_preference", (), tuple(d for d in _DIET_LABELS if d in diet_hits)
 
         # quantity pattern e.g., "2 fries" or "2 x fries"
-        qty_match = re.search(r"(\d+)\s*(?:x|pcs|pieces)?\s*(.+)", t)
+        qty_match = _RE_QTY.search(t)
         if qty_match:
             qty = int(qty_match.group(1))
-            item_text = qty_match.group(2)
-            matches = self.match_items(item_text)
-            for m in matches:
-                m.quantity = qty
+            item_text = qty_match.group(2).strip()
+            norm_it = self._normalize(item_text)
+            matches = self.match_items(item_text, _normalized=norm_it)
             if matches:
-                return {"intent": "order_food", "items": matches, "dietary": []}
+                return "order_food", tuple((m.menu_id, qty) for m in matches), ()
 
         # order verbs or short utterance (1-3 words)
-        if re.search(r"\b(order|i want|i'd like|get me|bring me|please get|i need)\b", t) or len(t.split()) <= 3:
-            matches = self.match_items(text)
+        if _RE_ORDER_VERB.search(t) or len(t.split()) <= 3:
+            # one Aho-Corasick pass + token lookups; "thanks"/"ok cool" simply find nothing
+            matches = self.match_items(t)
             if matches:
-                return {"intent": "order_food", "items": matches, "dietary": []}
+                return "order_food", tuple((m.menu_id, m.quantity) for m in matches), ()
             else:
                 # ambiguous short query -> clarify
-                return {"intent": "clarify", "items": [], "dietary": []}
+                return "clarify", (), ()
 
         # fallback unknown
-        return {"intent": "unknown", "items": [], "dietary": []}
+        return "unknown", (), ()
 
     # -------------------------
     # Session management (simple in-memory)
@@ -212,38 +316,46 @@ class AgentClient:
     def _load_session(self, session_id: Optional[str]) -> (str, Dict[str, Any]):
         if not session_id:
             session_id = f"guest-{int(time.time())}"
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {"preferences": {}, "pending": None, "history": []}
-        return session_id, self.sessions[session_id]
-
-    def _save_session(self, session_id: str, ctx: Dict[str, Any]):
-        self.sessions[session_id] = ctx
+        with self._sess_lock:
+            ctx = self.sessions.get(session_id)
+            if ctx is None:
+                ctx = {"preferences": {}, "pending": None, "history": []}
+                self.sessions[session_id] = ctx
+                if len(self.sessions) > MAX_SESSIONS:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(session_id)
+        # ctx is mutated in place by run(); no explicit save needed
+        return session_id, ctx
 
     # -------------------------
     # Core orchestrator
     # -------------------------
+    # Responses use ChatResponse.model_construct: every field is produced by this
+    # module, so pydantic validation/coercion would only re-check our own values.
     def run(self, request: ChatRequest) -> ChatResponse:
         text = request.message
+        if not text.strip():
+            # nothing to parse; don't create a session for it either
+            return ChatResponse.model_construct(session_id=request.session_id, reply="Please type a message.", intent="clarify")
         session_id, ctx = self._load_session(request.session_id)
 
         parsed = self.parse(text)
 
         # greeting
         if parsed["intent"] == "greeting":
-            return ChatResponse(session_id=session_id, reply="Hello! How can I help with room service today?", intent="greeting")
+            return ChatResponse.model_construct(session_id=session_id, reply="Hello! How can I help with room service today?", intent="greeting")
 
         # set preferences
         if parsed["intent"] == "set_preference":
             for p in parsed.get("dietary", []):
                 ctx["preferences"][p] = True
-            self._save_session(session_id, ctx)
-            return ChatResponse(session_id=session_id, reply=f"Saved preferences: {parsed.get('dietary')}", intent="set_preference", context={"preferences": ctx["preferences"]})
+            return ChatResponse.model_construct(session_id=session_id, reply=f"Saved preferences: {parsed.get('dietary')}", intent="set_preference", context={"preferences": ctx["preferences"]})
 
         # cancel
         if parsed["intent"] == "cancel":
             ctx["pending"] = None
-            self._save_session(session_id, ctx)
-            return ChatResponse(session_id=session_id, reply="Cancelled your pending request.", intent="cancel")
+            return ChatResponse.model_construct(session_id=session_id, reply="Cancelled your pending request.", intent="cancel")
 
         # confirm -> if pending order exists, place it (in-memory)
         if parsed["intent"] == "confirm":
@@ -251,58 +363,57 @@ class AgentClient:
                 order = ctx["pending"]
                 ctx["history"].append(order)
                 ctx["pending"] = None
-                self._save_session(session_id, ctx)
-                return ChatResponse(session_id=session_id, reply="Order placed. Thank you!", intent="confirm", context={"history": ctx["history"]})
+                return ChatResponse.model_construct(session_id=session_id, reply="Order placed. Thank you!", intent="confirm", context={"history": ctx["history"]})
             else:
-                return ChatResponse(session_id=session_id, reply="Nothing to confirm.", intent="confirm")
+                return ChatResponse.model_construct(session_id=session_id, reply="Nothing to confirm.", intent="confirm")
 
         # order flow
         if parsed["intent"] == "order_food":
             items: List[OrderItem] = parsed.get("items", [])
             if not items:
-                return ChatResponse(session_id=session_id, reply="I couldn't find that item. Can you name it differently?", intent="clarify", suggested_actions=["provide_item_name"])
+                return ChatResponse.model_construct(session_id=session_id, reply="I couldn't find that item. Can you name it differently?", intent="clarify", suggested_actions=["provide_item_name"])
+
+            # serialize once; conflict/unavailable lists reuse the same dicts
+            item_dicts = [i.to_dict() for i in items]
 
             # check preferences and availability
             prefs = ctx.get("preferences", {})
             conflicts = []
             unavailable = []
-            for o in items:
+            for o, d in zip(items, item_dicts):
                 tags = o.tags or []
                 if prefs.get("vegetarian") and any(t in ("non-veg", "chicken", "beef", "pork", "fish", "egg") for t in tags):
-                    conflicts.append(o)
+                    conflicts.append(d)
                 if not o.available:
-                    unavailable.append(o)
+                    unavailable.append(d)
 
             if conflicts:
-                names = ", ".join([c.name for c in conflicts])
-                ctx["pending"] = {"items": [asdict(i) for i in items]}
-                self._save_session(session_id, ctx)
-                return ChatResponse(
+                names = ", ".join([c["name"] for c in conflicts])
+                ctx["pending"] = {"items": item_dicts}
+                return ChatResponse.model_construct(
                     session_id=session_id,
                     reply=f"These items conflict with your dietary preferences: {names}. Replace or remove?",
                     intent="confirm",
                     suggested_actions=["replace_item", "remove_item"],
-                    context={"conflicts": [asdict(c) for c in conflicts]},
+                    context={"conflicts": conflicts},
                 )
 
             if unavailable:
-                names = ", ".join([u.name for u in unavailable])
-                ctx["pending"] = {"items": [asdict(i) for i in items]}
-                self._save_session(session_id, ctx)
-                return ChatResponse(
+                names = ", ".join([u["name"] for u in unavailable])
+                ctx["pending"] = {"items": item_dicts}
+                return ChatResponse.model_construct(
                     session_id=session_id,
                     reply=f"Sorry, these are currently unavailable: {names}. Would you like alternatives?",
                     intent="clarify",
                     suggested_actions=["offer_alternatives"],
-                    context={"unavailable": [asdict(u) for u in unavailable]},
+                    context={"unavailable": unavailable},
                 )
 
             # else prepare confirmation with ETA
             eta = sum([o.prep_time_min or 0 for o in items])
-            ctx["pending"] = {"items": [asdict(i) for i in items], "eta_min": eta}
-            self._save_session(session_id, ctx)
+            ctx["pending"] = {"items": item_dicts, "eta_min": eta}
             item_names = ", ".join([f"{i.quantity} x {i.name}" for i in items])
-            return ChatResponse(
+            return ChatResponse.model_construct(
                 session_id=session_id,
                 reply=f"Confirming: {item_names}. ETA ~{eta} minutes. Shall I place the order?",
                 intent="confirm_request",
@@ -312,7 +423,7 @@ class AgentClient:
 
         # clarify or unknown
         if parsed["intent"] in ("clarify", "unknown"):
-            return ChatResponse(
+            return ChatResponse.model_construct(
                 session_id=session_id,
                 reply="I didn't understand — can you specify the dish name (e.g., 'Grilled Chicken Sandwich')?",
                 intent="clarify",
@@ -320,7 +431,7 @@ class AgentClient:
             )
 
         # fallback
-        return ChatResponse(session_id=session_id, reply="Sorry, I couldn't process that.", intent="error")
+        return ChatResponse.model_construct(session_id=session_id, reply="Sorry, I couldn't process that.", intent="error")
 
 
 # single client instance & helper
@@ -1,50 +1,175 @@
+import email.message
+import json
 import logging
+import os
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+
+import anyio
+from fastapi import FastAPI, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.openapi.constants import REF_PREFIX
+from fastapi.openapi.utils import validation_error_definition, validation_error_response_definition
+from pydantic import ValidationError
 
 from .schemas import ChatRequest, ChatResponse
 from .agent import run_agent, client
 
 APP_TITLE = "Hotel Agent - Simple"
 APP_VERSION = "0.1.0"
+# same body HTTPException(500, "Internal server error") would produce, encoded once
+_ERR_500_BODY = b'{"detail":"Internal server error"}'
+# worker threads available to blocking LLM calls (Starlette's default is 40)
+THREADPOOL_TOKENS = 200
+
+# none of our formats use thread/process fields; skip collecting them per record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+
+class _CachedTimeFormatter(logging.Formatter):
+    """Formatter that calls strftime at most once per second (error bursts log many lines per second)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_sec = None
+        self._cached_str = ""
 
-logger = logging.getLogger(__name__)
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        sec = int(record.created)
+        if sec != self._cached_sec:
+            self._cached_str = time.strftime(self.default_time_format, self.converter(sec))
+            self._cached_sec = sec
+        return self.default_msec_format % (self._cached_str, record.msecs)
+
+
+logger = logging.getLogger("hotel_agent")
 logger.setLevel(logging.INFO)
+logger.propagate = False
 if not logger.handlers:
     ch = logging.StreamHandler()
-    ch.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    ch.setFormatter(_CachedTimeFormatter("%(asctime)s - %(levelname)s - %(message)s"))
     logger.addHandler(ch)
 
+def _json_bytes(payload) -> bytes:
+    # same compact encoding as Starlette's JSONResponse
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# backend is fixed once src.agent is imported, so the status payloads are encoded once here
+# (not in lifespan, which doesn't run for mounted sub-apps or a bare TestClient)
+_BACKEND = getattr(client, "backend", "mock")
+_ROOT_BYTES = _json_bytes({"status": "ok", "app": APP_TITLE, "version": APP_VERSION, "backend": _BACKEND})
+_HEALTH_BYTES = _json_bytes({"status": "ok", "backend": _BACKEND})
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("Starting app - backend=%s", getattr(client, "backend", "mock"))
+    logger.info("Starting app - backend=%s", _BACKEND)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
     yield
     logger.info("Stopping app")
 
-app = FastAPI(title=APP_TITLE, version=APP_VERSION, lifespan=lifespan)
+# production builds skip the Swagger/ReDoc routes and OpenAPI schema generation
+_DOCS_KWARGS = {"docs_url": None, "redoc_url": None, "openapi_url": None} if os.getenv("ENV") == "prod" else {}
+
+# redirect_slashes=False: a wrong trailing slash is a 404, not an extra 307 round trip
+app = FastAPI(title=APP_TITLE, version=APP_VERSION, lifespan=lifespan, redirect_slashes=False, **_DOCS_KWARGS)
+
+# comma-separated allowlist; "*" is fine for local/demo, narrow it in production
+CORS_ALLOW_ORIGINS = [o.strip() for o in os.environ.get("CORS_ALLOW_ORIGINS", "*").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],   # fine for local/demo; narrow in production
+    allow_origins=CORS_ALLOW_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,   # let browsers cache preflights for a day
 )
 
 @app.get("/")
-def root():
-    return {"status": "ok", "app": APP_TITLE, "version": APP_VERSION, "backend": getattr(client, "backend", "mock")}
+async def root():
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 @app.get("/health")
-def health():
-    return {"status": "ok", "backend": getattr(client, "backend", "mock")}
+async def health():
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
+
+# /chat reads the raw body itself (see below); describe it for the OpenAPI docs the way
+# FastAPI would for a ChatRequest body parameter
+_CHAT_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"$ref": REF_PREFIX + "ChatRequest"}}},
+    },
+    "responses": {
+        "422": {
+            "description": "Validation Error",
+            "content": {"application/json": {"schema": {"$ref": REF_PREFIX + "HTTPValidationError"}}},
+        }
+    },
+}
+
+_default_openapi = app.openapi
+
+def _openapi():
+    # register the schemas referenced above, which FastAPI can't discover from the signature
+    schema = _default_openapi()
+    components = schema.setdefault("components", {}).setdefault("schemas", {})
+    components.setdefault("ChatRequest", ChatRequest.model_json_schema(ref_template=REF_PREFIX + "{model}"))
+    components.setdefault("ValidationError", validation_error_definition)
+    components.setdefault("HTTPValidationError", validation_error_response_definition)
+    return schema
+
+app.openapi = _openapi
+
+def _is_json_content_type(value: Optional[str]) -> bool:
+    # FastAPI's rule (its CSRF guard): no Content-Type, application/json or application/*+json;
+    # text/plain etc. would let cross-site "simple" requests skip the CORS preflight
+    if not value:
+        return True
+    message = email.message.Message()
+    message["content-type"] = value
+    if message.get_content_maintype() != "application":
+        return False
+    subtype = message.get_content_subtype()
+    return subtype == "json" or subtype.endswith("+json")
+
+@app.post("/chat", response_model=ChatResponse, openapi_extra=_CHAT_REQUEST_OPENAPI)
+async def chat_endpoint(http_request: Request):
+    body = await http_request.body()
+    if not _is_json_content_type(http_request.headers.get("content-type")):
+        raise RequestValidationError([{
+            "type": "model_attributes_type",
+            "loc": ("body",),
+            "msg": "Input should be a valid dictionary or object to extract fields from",
+            # decoded leniently: the 422 handler would choke on non-UTF-8 bytes
+            "input": body.decode("utf-8", errors="replace"),
+        }])
+
+    # single-pass parse + validate in pydantic-core instead of json.loads then validate
+    try:
+        request = ChatRequest.model_validate_json(body)
+    except ValidationError as e:
+        # like FastAPI, don't echo an unparseable body back (it may not even be UTF-8)
+        raise RequestValidationError([
+            {**err, "loc": ("body", *err["loc"]), **({"input": {}} if err["type"] == "json_invalid" else {})}
+            for err in e.errors(include_url=False)
+        ])
 
-@app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
     try:
-        response = run_agent(request)
+        if client.backend == "mock":
+            # rule-based path is CPU-only and fast; run it on the event loop
+            response = run_agent(request)
+        else:
+            # LLM backends block on network I/O; keep them off the event loop
+            response = await anyio.to_thread.run_sync(run_agent, request)
         return response
     except Exception:
         logger.exception("Unhandled error in /chat")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        # new Response each time: middleware mutates headers on the instance it sends
+        return Response(content=_ERR_500_BODY, status_code=500, media_type="application/json")
\ No newline at end of file
@@ -1,13 +1,24 @@
 # src/schemas.py
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 
+# longest guest message accepted; longer bodies are rejected with a 422 by pydantic-core
+MAX_MESSAGE_LEN = 4000
+
+# Unknown keys are ignored rather than stored, and ChatResponse instances
+# returned by the agent are passed through without re-validation on /chat.
+_FAST_CONFIG = ConfigDict(extra="ignore", revalidate_instances="never", validate_assignment=False)
+
 class ChatRequest(BaseModel):
+    model_config = _FAST_CONFIG
+
     session_id: Optional[str] = None
     guest_id: Optional[str] = None
-    message: str
+    message: str = Field(max_length=MAX_MESSAGE_LEN)
 
 class ChatResponse(BaseModel):
+    model_config = _FAST_CONFIG
+
     session_id: Optional[str] = None
     reply: str
     intent: Optional[str] = None